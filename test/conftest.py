@@ -0,0 +1,40 @@
+from __future__ import division
+
+import pytest
+
+from pyopencl.tools import clear_first_arg_caches
+
+
+@pytest.fixture(scope="module")
+def device_cache(request):
+    """A dictionary for objects that the tests of one module share between
+    runs on the same device. Use it through :func:`get_device_shared`.
+    """
+    result = {}
+
+    def release():
+        result.clear()
+        # The first-arg caches hold on to the same contexts, e.g. through
+        # memoized kernels or allocators.
+        clear_first_arg_caches()
+
+    request.addfinalizer(release)
+    return result
+
+
+@pytest.fixture
+def get_device_shared(ctx_factory, device_cache):
+    """A function ``get_device_shared(key, make)`` that returns
+    ``make(context)`` for a context on the device of *ctx_factory*. Both are
+    created by the first call for a given device and *key*, and taken from
+    :func:`device_cache` afterwards.
+    """
+    def get(key, make):
+        cache_key = (ctx_factory.device, key)
+        try:
+            return device_cache[cache_key]
+        except KeyError:
+            result = device_cache[cache_key] = make(ctx_factory())
+            return result
+
+    return get
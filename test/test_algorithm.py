@@ -25,21 +25,70 @@ THE SOFTWARE.
 """
 
 import numpy as np
-import numpy.linalg as la
 import sys
 from pytools import memoize
 from test_array import general_clrand
+from testlib import host_randint
 
 import pytest
 
 import pyopencl as cl
 import pyopencl.array as cl_array  # noqa
 from pyopencl.tools import (  # noqa
-        pytest_generate_tests_for_pyopencl as pytest_generate_tests)
+        pytest_generate_tests_for_pyopencl as pytest_generate_tests,
+        context_dependent_memoize)
 from pyopencl.characterize import has_double_support
 from pyopencl.scan import InclusiveScanKernel, ExclusiveScanKernel
 
 
+# {{{ program cache warmup
+
+@pytest.fixture(scope="module")
+def warm_program_cache():
+    """Build kernels that recur throughout this module once per test device,
+    so that the tests' own builds of the same source are served from the
+    on-disk program cache in :mod:`pyopencl.cache`.
+
+    Build failures are ignored here; the tests' own builds report them.
+    """
+    from pyopencl.tools import (get_test_platforms_and_devices,
+            clear_first_arg_caches)
+    from pyopencl.elementwise import ElementwiseKernel
+
+    try:
+        import mako  # noqa
+    except ImportError:
+        have_mako = False
+    else:
+        have_mako = True
+
+    for platform, devices in get_test_platforms_and_devices():
+        for device in devices:
+            try:
+                context = cl.Context([device])
+                queue = cl.CommandQueue(context)
+
+                set_to_seven = ElementwiseKernel(context,
+                        "float *z", "z[i] = 7", "set_to_seven")
+                set_to_seven(cl_array.empty(queue, 16, np.float32))
+
+                if have_mako:
+                    from pyopencl.algorithm import RadixSort
+
+                    InclusiveScanKernel(context, np.int32, "a+b", "0")
+                    RadixSort(context, "int *ary", key_expr="ary[i]",
+                            sort_arg_names=["ary"])
+
+                queue.finish()
+            except cl.Error:
+                pass
+
+    # don't keep the warmup contexts alive through the build caches
+    clear_first_arg_caches()
+
+# }}}
+
+
 # {{{ elementwise
 
 def test_elwise_kernel(ctx_factory):
@@ -60,7 +109,8 @@ def test_elwise_kernel(ctx_factory):
     c_gpu = cl_array.empty_like(a_gpu)
     lin_comb(5, a_gpu, 6, b_gpu, c_gpu)
 
-    assert la.norm((c_gpu - (5 * a_gpu + 6 * b_gpu)).get()) < 1e-5
+    np.testing.assert_allclose(
+            (c_gpu - (5 * a_gpu + 6 * b_gpu)).get(), 0, atol=1e-5)
 
 
 def test_elwise_kernel_with_options(ctx_factory):
@@ -91,9 +141,10 @@ def test_elwise_kernel_with_options(ctx_factory):
 
     gt = in_gpu.get() + 1
     gv = out_gpu.get()
-    assert la.norm(gv - gt) < 1e-5
+    np.testing.assert_allclose(gv, gt, rtol=0, atol=1e-5)
 
 
+@pytest.mark.usefixtures("warm_program_cache")
 def test_ranged_elwise_kernel(ctx_factory):
     context = ctx_factory()
     queue = cl.CommandQueue(context)
@@ -102,6 +153,10 @@ def test_ranged_elwise_kernel(ctx_factory):
     set_to_seven = ElementwiseKernel(context,
             "float *z", "z[i] = 7", "set_to_seven")
 
+    a_gpu = cl_array.empty(queue, (50000,), dtype=np.float32)
+    a_cpu = np.empty(a_gpu.shape, a_gpu.dtype)
+    result = np.empty(a_gpu.shape, a_gpu.dtype)
+
     for i, slc in enumerate([
             slice(5, 20000),
             slice(5, 20000, 17),
@@ -109,13 +164,13 @@ def test_ranged_elwise_kernel(ctx_factory):
             slice(1000, -1),
             ]):
 
-        a_gpu = cl_array.zeros(queue, (50000,), dtype=np.float32)
-        a_cpu = np.zeros(a_gpu.shape, a_gpu.dtype)
+        a_gpu.fill(0)
+        a_cpu.fill(0)
 
         a_cpu[slc] = 7
         set_to_seven(a_gpu, slice=slc)
 
-        assert (a_cpu == a_gpu.get()).all()
+        assert (a_cpu == a_gpu.get(ary=result)).all()
 
 
 def test_take(ctx_factory):
@@ -165,31 +220,30 @@ def test_if_positive(ctx_factory):
     max_a_b_gpu = cl_array.maximum(a_gpu, b_gpu)
     min_a_b_gpu = cl_array.minimum(a_gpu, b_gpu)
 
-    print(max_a_b_gpu)
-    print(np.maximum(a, b))
-
-    assert la.norm(max_a_b_gpu.get() - np.maximum(a, b)) == 0
-    assert la.norm(min_a_b_gpu.get() - np.minimum(a, b)) == 0
+    np.testing.assert_array_equal(max_a_b_gpu.get(), np.maximum(a, b))
+    np.testing.assert_array_equal(min_a_b_gpu.get(), np.minimum(a, b))
 
 
 def test_take_put(ctx_factory):
     context = ctx_factory()
     queue = cl.CommandQueue(context)
 
+    one_field_size = 8
+    dest_indices = cl_array.to_device(queue,
+            np.array([0, 1, 2,  3, 32, 33, 34, 35], dtype=np.uint32))
+    read_map = cl_array.to_device(queue,
+            np.array([7, 6, 5, 4, 3, 2, 1, 0], dtype=np.uint32))
+
     for n in [5, 17, 333]:
-        one_field_size = 8
         buf_gpu = cl_array.zeros(queue,
                 n * one_field_size, dtype=np.float32)
-        dest_indices = cl_array.to_device(queue,
-                np.array([0, 1, 2,  3, 32, 33, 34, 35], dtype=np.uint32))
-        read_map = cl_array.to_device(queue,
-                np.array([7, 6, 5, 4, 3, 2, 1, 0], dtype=np.uint32))
 
         cl_array.multi_take_put(
                 arrays=[buf_gpu for i in range(n)],
                 dest_indices=dest_indices,
                 src_indices=read_map,
-                src_offsets=[i * one_field_size for i in range(n)],
+                src_offsets=(
+                    np.arange(n, dtype=np.uint32) * one_field_size).tolist(),
                 dest_shape=(96,))
 
 
@@ -209,7 +263,7 @@ def test_astype(ctx_factory):
     a2 = a_gpu.astype(np.float64).get()
 
     assert a2.dtype == np.float64
-    assert la.norm(a - a2) == 0, (a, a2)
+    np.testing.assert_array_equal(a, a2)
 
     a_gpu = clrand(queue, (2000,), dtype=np.float64)
 
@@ -217,7 +271,7 @@ def test_astype(ctx_factory):
     a2 = a_gpu.astype(np.float32).get()
 
     assert a2.dtype == np.float32
-    assert la.norm(a - a2) / la.norm(a) < 1e-7
+    np.testing.assert_allclose(a2, a, rtol=1e-7)
 
 # }}}
 
@@ -237,14 +291,19 @@ def test_sum(ctx_factory):
 
         a = a_gpu.get()
 
-        for slc in [
+        slices = [
                 slice(None),
                 slice(1000, 3000),
                 slice(1000, -3000),
                 slice(1000, None),
-                ]:
+                ]
+
+        # enqueue all reductions (on views of a_gpu) before reading any back
+        sums_gpu = [cl_array.sum(a_gpu[slc]) for slc in slices]
+
+        for slc, sum_a_gpu in zip(slices, sums_gpu):
             sum_a = np.sum(a[slc])
-            sum_a_gpu = cl_array.sum(a_gpu[slc]).get()
+            sum_a_gpu = sum_a_gpu.get()
 
             assert abs(sum_a_gpu - sum_a) / abs(sum_a) < 1e-4
 
@@ -292,22 +351,18 @@ def test_subset_minmax(ctx_factory):
     else:
         dtypes = [np.float32, np.int32]
 
+    # every index except the nonzero multiples of gran
+    all_indices = np.arange(l_m + l_m // (gran - 1) + 1, dtype=np.int32)
+    meaningful_indices = all_indices[
+            (all_indices % gran != 0) | (all_indices == 0)][:l_m]
+
+    meaningful_indices_gpu = cl_array.to_device(
+            queue, meaningful_indices)
+
     for dtype in dtypes:
         a_gpu = clrand(queue, (l_a,), dtype)
         a = a_gpu.get()
 
-        meaningful_indices_gpu = cl_array.zeros(
-                queue, l_m, dtype=np.int32)
-        meaningful_indices = meaningful_indices_gpu.get()
-        j = 0
-        for i in range(len(meaningful_indices)):
-            meaningful_indices[i] = j
-            j = j + 1
-            if j % gran == 0:
-                j = j + 1
-
-        meaningful_indices_gpu = cl_array.to_device(
-                queue, meaningful_indices)
         b = a[meaningful_indices]
 
         min_a = np.min(b)
@@ -327,13 +382,15 @@ def test_dot(ctx_factory):
     if has_double_support(context.devices[0]):
         dtypes.extend([np.float64, np.complex128])
 
-    for a_dtype in dtypes:
-        for b_dtype in dtypes:
+    # one pair of operands per dtype, shared by all dtype combinations
+    a_gpus = [general_clrand(queue, (200000,), dtype) for dtype in dtypes]
+    b_gpus = [general_clrand(queue, (200000,), dtype) for dtype in dtypes]
+    a_hosts = [a_gpu.get() for a_gpu in a_gpus]
+    b_hosts = [b_gpu.get() for b_gpu in b_gpus]
+
+    for a_dtype, a_gpu, a in zip(dtypes, a_gpus, a_hosts):
+        for b_dtype, b_gpu, b in zip(dtypes, b_gpus, b_hosts):
             print(a_dtype, b_dtype)
-            a_gpu = general_clrand(queue, (200000,), a_dtype)
-            a = a_gpu.get()
-            b_gpu = general_clrand(queue, (200000,), b_dtype)
-            b = b_gpu.get()
 
             dot_ab = np.dot(a, b)
             dot_ab_gpu = cl_array.dot(a_gpu, b_gpu).get()
@@ -363,17 +420,8 @@ def make_mmc_dtype(device):
     return dtype, c_decl
 
 
-def test_struct_reduce(ctx_factory):
-    pytest.importorskip("mako")
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    dev, = context.devices
-    if (dev.vendor == "NVIDIA" and dev.platform.vendor == "Apple"
-            and dev.driver_version == "8.12.47 310.40.00.05f01"):
-        pytest.skip("causes a compiler hang on Apple/Nv GPU")
-
+@context_dependent_memoize
+def make_mmc_reduction_kernel(context):
     mmc_dtype, mmc_c_decl = make_mmc_dtype(context.devices[0])
 
     preamble = mmc_c_decl + r"""//CL//
@@ -407,16 +455,30 @@ def test_struct_reduce(ctx_factory):
 
     """
 
-    from pyopencl.clrandom import rand as clrand
-    a_gpu = clrand(queue, (20000,), dtype=np.int32, a=0, b=10**6)
-    a = a_gpu.get()
-
     from pyopencl.reduction import ReductionKernel
-    red = ReductionKernel(context, mmc_dtype,
+    return ReductionKernel(context, mmc_dtype,
             neutral="mmc_neutral()",
             reduce_expr="agg_mmc(a, b)", map_expr="mmc_from_scalar(x[i])",
             arguments="__global int *x", preamble=preamble)
 
+
+def test_struct_reduce(ctx_factory):
+    pytest.importorskip("mako")
+
+    context = ctx_factory()
+    queue = cl.CommandQueue(context)
+
+    dev, = context.devices
+    if (dev.vendor == "NVIDIA" and dev.platform.vendor == "Apple"
+            and dev.driver_version == "8.12.47 310.40.00.05f01"):
+        pytest.skip("causes a compiler hang on Apple/Nv GPU")
+
+    from pyopencl.clrandom import rand as clrand
+    a_gpu = clrand(queue, (20000,), dtype=np.int32, a=0, b=10**6)
+    a = a_gpu.get()
+
+    red = make_mmc_reduction_kernel(context)
+
     minmax = red(a_gpu).get()
     #print minmax["cur_min"], minmax["cur_max"]
     #print np.min(a), np.max(a)
@@ -434,40 +496,32 @@ def summarize_error(obtained, desired, orig, thresh=1e-5):
     importorskip("mako")
 
     err = obtained - desired
-    ok_count = 0
-    bad_count = 0
+    bad = np.abs(err) > thresh
 
     bad_limit = 200
 
-    def summarize_counts():
-        if ok_count:
-            entries.append("<%d ok>" % ok_count)
-        if bad_count >= bad_limit:
-            entries.append("<%d more bad>" % (bad_count-bad_limit))
+    # split into maximal runs of all-ok or all-bad entries
+    run_bounds = np.flatnonzero(bad[1:] != bad[:-1]) + 1
+    run_starts = np.concatenate([[0], run_bounds])
+    run_ends = np.concatenate([run_bounds, [len(err)]])
 
     entries = []
-    for i, val in enumerate(err):
-        if abs(val) > thresh:
-            if ok_count:
-                summarize_counts()
-                ok_count = 0
-
-            bad_count += 1
+    for start, end in zip(run_starts, run_ends):
+        if start == end:
+            continue
 
-            if bad_count < bad_limit:
+        if bad[start]:
+            for i in range(start, min(end, start + bad_limit - 1)):
                 entries.append("%r (want: %r, got: %r, orig: %r)" % (
                     obtained[i], desired[i], obtained[i], orig[i]))
+            if end - start >= bad_limit:
+                entries.append("<%d more bad>" % (end - start - bad_limit))
         else:
-            if bad_count:
-                summarize_counts()
-                bad_count = 0
-
-            ok_count += 1
-
-    summarize_counts()
+            entries.append("<%d ok>" % (end - start))
 
     return " ".join(entries)
 
+
 scan_test_counts = [
     10,
     2 ** 8 - 1,
@@ -488,6 +542,7 @@ scan_test_counts = [
     ]
 
 
+@pytest.mark.usefixtures("warm_program_cache")
 @pytest.mark.parametrize("dtype", [np.int32, np.int64])
 @pytest.mark.parametrize("scan_cls", [InclusiveScanKernel, ExclusiveScanKernel])
 def test_scan(ctx_factory, dtype, scan_cls):
@@ -499,28 +554,36 @@ def test_scan(ctx_factory, dtype, scan_cls):
 
     knl = scan_cls(context, dtype, "a+b", "0")
 
+    # host-side buffers, sized for the largest n and reused across sizes
+    max_n = max(scan_test_counts)
+    host_buf = np.empty(max_n, dtype)
+    desired_buf = np.empty(max_n, dtype)
+    result_buf = np.empty(max_n, dtype)
+
     for n in scan_test_counts:
-        host_data = np.random.randint(0, 10, n).astype(dtype)
+        host_data = host_buf[:n]
+        host_data[:] = host_randint(0, 10, n, dtype)
         dev_data = cl_array.to_device(queue, host_data)
 
+        result = dev_data.get(ary=result_buf[:n])
+
         # /!\ fails on Nv GT2?? for some drivers
-        assert (host_data == dev_data.get()).all()
+        assert (host_data == result).all()
 
         knl(dev_data)
 
-        desired_result = np.cumsum(host_data, axis=0)
+        desired_result = np.cumsum(host_data, axis=0, out=desired_buf[:n])
         if scan_cls is ExclusiveScanKernel:
             desired_result -= host_data
 
-        is_ok = (dev_data.get() == desired_result).all()
+        result = dev_data.get(ary=result_buf[:n])
+        is_ok = (result == desired_result).all()
         if 1 and not is_ok:
             print("something went wrong, summarizing error...")
-            print(summarize_error(dev_data.get(), desired_result, host_data))
+            print(summarize_error(result, desired_result, host_data))
 
         print("dtype:%s n:%d %s worked:%s" % (dtype, n, scan_cls, is_ok))
         assert is_ok
-        from gc import collect
-        collect()
 
 
 def test_copy_if(ctx_factory):
@@ -531,20 +594,20 @@ def test_copy_if(ctx_factory):
     queue = cl.CommandQueue(context)
 
     from pyopencl.clrandom import rand as clrand
+    from pyopencl.algorithm import copy_if
+
     for n in scan_test_counts:
         a_dev = clrand(queue, (n,), dtype=np.int32, a=0, b=1000)
         a = a_dev.get()
 
-        from pyopencl.algorithm import copy_if
-
         crit = a_dev.dtype.type(300)
         selected = a[a > crit]
         selected_dev, count_dev, evt = copy_if(
                 a_dev, "ary[i] > myval", [("myval", crit)])
 
-        assert (selected_dev.get()[:count_dev.get()] == selected).all()
-        from gc import collect
-        collect()
+        count = int(count_dev.get())
+
+        assert (selected_dev[:count].get() == selected).all()
 
 
 def test_partition(ctx_factory):
@@ -555,6 +618,8 @@ def test_partition(ctx_factory):
     queue = cl.CommandQueue(context)
 
     from pyopencl.clrandom import rand as clrand
+    from pyopencl.algorithm import partition
+
     for n in scan_test_counts:
         print("part", n)
 
@@ -565,14 +630,13 @@ def test_partition(ctx_factory):
         true_host = a[a > crit]
         false_host = a[a <= crit]
 
-        from pyopencl.algorithm import partition
         true_dev, false_dev, count_true_dev, evt = partition(
                 a_dev, "ary[i] > myval", [("myval", crit)])
 
-        count_true_dev = count_true_dev.get()
+        count_true = int(count_true_dev.get())
 
-        assert (true_dev.get()[:count_true_dev] == true_host).all()
-        assert (false_dev.get()[:n-count_true_dev] == false_host).all()
+        assert (true_dev[:count_true].get() == true_host).all()
+        assert (false_dev[:n-count_true].get() == false_host).all()
 
 
 def test_unique(ctx_factory):
@@ -583,6 +647,8 @@ def test_unique(ctx_factory):
     queue = cl.CommandQueue(context)
 
     from pyopencl.clrandom import rand as clrand
+    from pyopencl.algorithm import unique
+
     for n in scan_test_counts:
         a_dev = clrand(queue, (n,), dtype=np.int32, a=0, b=1000)
         a = a_dev.get()
@@ -591,14 +657,11 @@ def test_unique(ctx_factory):
 
         a_unique_host = np.unique(a)
 
-        from pyopencl.algorithm import unique
         a_unique_dev, count_unique_dev, evt = unique(a_dev)
 
-        count_unique_dev = count_unique_dev.get()
+        count_unique = int(count_unique_dev.get())
 
-        assert (a_unique_dev.get()[:count_unique_dev] == a_unique_host).all()
-        from gc import collect
-        collect()
+        assert (a_unique_dev[:count_unique].get() == a_unique_host).all()
 
 
 def test_index_preservation(ctx_factory):
@@ -616,22 +679,20 @@ def test_index_preservation(ctx_factory):
         classes.append(GenericDebugScanKernel)
 
     for cls in classes:
-        for n in scan_test_counts:
-            knl = cls(
-                    context, np.int32,
-                    arguments="__global int *out",
-                    input_expr="i",
-                    scan_expr="b", neutral="0",
-                    output_statement="""
-                        out[i] = item;
-                        """)
+        knl = cls(
+                context, np.int32,
+                arguments="__global int *out",
+                input_expr="i",
+                scan_expr="b", neutral="0",
+                output_statement="""
+                    out[i] = item;
+                    """)
 
+        for n in scan_test_counts:
             out = cl_array.empty(queue, n, dtype=np.int32)
             knl(out)
 
             assert (out.get() == np.arange(n)).all()
-            from gc import collect
-            collect()
 
 
 def test_segmented_scan(ctx_factory):
@@ -663,7 +724,6 @@ def test_segmented_scan(ctx_factory):
                 options=[])
 
         np.set_printoptions(threshold=2000)
-        from random import randrange
         from pyopencl.clrandom import rand as clrand
         for n in scan_test_counts:
             a_dev = clrand(queue, (n,), dtype=dtype, a=0, b=10)
@@ -677,14 +737,14 @@ def test_segmented_scan(ctx_factory):
                         ]
             else:
                 seg_boundaries_values = []
-                for i in range(10):
-                    seg_boundary_count = max(2, min(100, randrange(0, int(0.4*n))))
-                    seg_boundaries = [
-                            randrange(n) for i in range(seg_boundary_count)]
+                seg_boundary_counts = np.clip(
+                        host_randint(0, int(0.4*n), 10, np.int32), 2, 100)
+                for seg_boundary_count in seg_boundary_counts:
+                    seg_boundaries = host_randint(
+                            0, n, seg_boundary_count, np.intp)
                     if n >= 1029:
-                        seg_boundaries.insert(0, 1028)
-                    seg_boundaries.sort()
-                    seg_boundaries_values.append(seg_boundaries)
+                        seg_boundaries = np.append(seg_boundaries, 1028)
+                    seg_boundaries_values.append(np.sort(seg_boundaries))
 
             for seg_boundaries in seg_boundaries_values:
                 #print "BOUNDARIES", seg_boundaries
@@ -695,22 +755,14 @@ def test_segmented_scan(ctx_factory):
                 seg_boundary_flags_dev = cl_array.to_device(
                         queue, seg_boundary_flags)
 
-                seg_boundaries.insert(0, 0)
-
-                result_host = a.copy()
-                for i, seg_start in enumerate(seg_boundaries):
-                    if i+1 < len(seg_boundaries):
-                        seg_end = seg_boundaries[i+1]
-                    else:
-                        seg_end = None
-
-                    if is_exclusive:
-                        result_host[seg_start+1:seg_end] = np.cumsum(
-                                a[seg_start:seg_end][:-1])
-                        result_host[seg_start] = 0
-                    else:
-                        result_host[seg_start:seg_end] = np.cumsum(
-                                a[seg_start:seg_end])
+                # subtract from the global prefix sum whatever had accumulated
+                # before the start of each element's segment
+                inclusive_sums = np.cumsum(a, dtype=a.dtype)
+                seg_starts = np.maximum.accumulate(
+                        np.where(seg_boundary_flags, np.arange(n), 0))
+                result_host = inclusive_sums - (inclusive_sums - a)[seg_starts]
+                if is_exclusive:
+                    result_host -= a
 
                 #print "REF", result_host
 
@@ -718,20 +770,20 @@ def test_segmented_scan(ctx_factory):
                 knl(a_dev, seg_boundary_flags_dev, result_dev)
 
                 #print "RES", result_dev
-                is_correct = (result_dev.get() == result_host).all()
+                result = result_dev.get()
+                is_correct = (result == result_host).all()
                 if not is_correct:
-                    diff = result_dev.get() - result_host
+                    diff = result - result_host
                     print("RES-REF", diff)
                     print("ERRWHERE", np.where(diff))
                     print(n, list(seg_boundaries))
 
                 assert is_correct
-                from gc import collect
-                collect()
 
             print("%d excl:%s done" % (n, is_exclusive))
 
 
+@pytest.mark.usefixtures("warm_program_cache")
 def test_sort(ctx_factory):
     from pytest import importorskip
     importorskip("mako")
@@ -793,6 +845,10 @@ def test_list_builder(ctx_factory):
             }
             """, arg_decls=[])
 
+    # builds and caches the kernels; object 0 appends nothing
+    result, evt = builder(queue, 1)
+    assert result["mylist"].count == 0
+
     result, evt = builder(queue, 2000)
 
     inf = result["mylist"]
@@ -813,7 +869,10 @@ def test_key_value_sorter(ctx_factory):
     keys = clrand(queue, n, np.int32, b=nkeys)
     values = clrand(queue, n, np.int32, b=n).astype(np.int64)
 
-    assert np.max(keys.get()) < nkeys
+    keys_host = keys.get()
+    values_host = values.get()
+
+    assert np.max(keys_host) < nkeys
 
     from pyopencl.algorithm import KeyValueSorter
     kvs = KeyValueSorter(context)
@@ -822,13 +881,15 @@ def test_key_value_sorter(ctx_factory):
     starts = starts.get()
     lists = lists.get()
 
-    mydict = dict()
-    for k, v in zip(keys.get(), values.get()):
-        mydict.setdefault(k, []).append(v)
+    ref_starts = np.concatenate([[0], np.cumsum(np.bincount(
+        keys_host, minlength=nkeys))])
+    assert (starts == ref_starts).all()
 
-    for i in range(nkeys):
-        start, end = starts[i:i+2]
-        assert sorted(mydict[i]) == sorted(lists[start:end])
+    # order within each list is unspecified, so sort by (key, value) on
+    # both sides before comparing
+    list_keys = np.repeat(np.arange(nkeys), np.diff(starts))
+    ref_values = values_host[np.lexsort((values_host, keys_host))]
+    assert (lists[np.lexsort((lists, list_keys))] == ref_values).all()
 
 # }}}
 
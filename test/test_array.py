@@ -26,140 +26,166 @@ THE SOFTWARE.
 import numpy as np
 import numpy.linalg as la
 import sys
+import pytest
+from operator import add, mul, sub, truediv
 
 import pyopencl as cl
 import pyopencl.array as cl_array
 import pyopencl.tools as cl_tools
 from pyopencl.tools import (  # noqa
-        pytest_generate_tests_for_pyopencl as pytest_generate_tests)
+        pytest_generate_tests_for_pyopencl as pytest_generate_tests,
+        first_arg_dependent_memoize)
 from pyopencl.characterize import has_double_support
 
+from testlib import get_host_allocator, host_view
 
-# {{{ helpers
 
-TO_REAL = {
-        np.dtype(np.complex64): np.float32,
-        np.dtype(np.complex128): np.float64
-        }
+# {{{ shared queue and arrays
+
+@pytest.fixture
+def queue(get_device_shared):
+    """A :class:`pyopencl.CommandQueue` on the device of *ctx_factory*, shared
+    by all tests in this module that run on the same device.
+    """
+    return get_device_shared("queue", cl.CommandQueue)
+
+
+@first_arg_dependent_memoize
+def get_shared_arange(queue, start, stop, shape):
+    a = np.arange(start, stop).reshape(shape).astype(np.float32)
+    a.setflags(write=False)
+    return a, cl_array.to_device(queue, a)
+
+
+@pytest.fixture
+def a10_gpu(queue):
+    """``[1, ..., 10]`` in float32, as a tuple of host and device array.
+    Shared between tests, so neither may be modified.
+    """
+    return get_shared_arange(queue, 1, 11, (10,))
+
 
+@pytest.fixture
+def a128_gpu(queue):
+    """``arange(128)`` in float32 and shape ``(8, 16)``, as a tuple of host
+    and device array. Shared between tests, so neither may be modified.
+    """
+    return get_shared_arange(queue, 0, 128, (8, 16))
+
+# }}}
+
+
+# {{{ helpers
 
 def general_clrand(queue, shape, dtype):
     from pyopencl.clrandom import rand as clrand
 
     dtype = np.dtype(dtype)
     if dtype.kind == "c":
+        # draw real and imaginary parts in one go, interleaved
         real_dtype = dtype.type(0).real.dtype
-        return clrand(queue, shape, real_dtype) + 1j*clrand(queue, shape, real_dtype)
+        shape = tuple(shape) if isinstance(shape, (tuple, list)) else (shape,)
+        return clrand(queue, shape[:-1] + (2*shape[-1],), real_dtype).view(dtype)
     else:
         return clrand(queue, shape, dtype)
 
 
 def make_random_array(queue, dtype, size):
-    from pyopencl.clrandom import rand
+    return general_clrand(queue, (size,), dtype)
 
-    dtype = np.dtype(dtype)
-    if dtype.kind == "c":
-        real_dtype = TO_REAL[dtype]
-        return (rand(queue, shape=(size,), dtype=real_dtype).astype(dtype)
-                + rand(queue, shape=(size,), dtype=real_dtype).astype(dtype)
-                * dtype.type(1j))
-    else:
-        return rand(queue, shape=(size,), dtype=dtype)
 
-# }}}
+def host_clrand(queue, shape, dtype):
+    """Like :func:`pyopencl.clrandom.rand`, but allocates the result (and thus
+    everything computed from it) through :func:`get_host_allocator`.
+    """
+    from pyopencl.clrandom import _get_generator
 
+    gen = _get_generator(queue)
+    result = cl_array.empty(queue, shape, dtype,
+            allocator=get_host_allocator(queue.context))
+    result.add_event(gen.fill_uniform(result))
+    return result
 
-# {{{ dtype-related
+# }}}
 
-def test_basic_complex(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
 
-    from pyopencl.clrandom import rand
+# {{{ dtype-related
 
+def test_basic_complex(queue):
     size = 500
 
-    ary = (rand(queue, shape=(size,), dtype=np.float32).astype(np.complex64)
-            + rand(queue, shape=(size,), dtype=np.float32).astype(np.complex64) * 1j)
+    ary = make_random_array(queue, np.complex64, size)
     c = np.complex64(5+7j)
 
     host_ary = ary.get()
     assert la.norm((ary*c).get() - c*host_ary) < 1e-5 * la.norm(host_ary)
 
 
-def test_mix_complex(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    size = 10
-
-    dtypes = [
-            (np.float32, np.complex64),
-            #(np.int32, np.complex64),
-            ]
-
-    if has_double_support(context.devices[0]):
-        dtypes.extend([
-            (np.float32, np.float64),
-            (np.float32, np.complex128),
-            (np.float64, np.complex64),
-            (np.float64, np.complex128),
-            ])
-
-    from operator import add, mul, sub, truediv
-    for op in [add, sub, mul, truediv, pow]:
-        for dtype_a0, dtype_b0 in dtypes:
-            for dtype_a, dtype_b in [
-                    (dtype_a0, dtype_b0),
-                    (dtype_b0, dtype_a0),
-                    ]:
-                for is_scalar_a, is_scalar_b in [
-                        (False, False),
-                        (False, True),
-                        (True, False),
-                        ]:
-                    if is_scalar_a:
-                        ary_a = make_random_array(queue, dtype_a, 1).get()[0]
-                        host_ary_a = ary_a
-                    else:
-                        ary_a = make_random_array(queue, dtype_a, size)
-                        host_ary_a = ary_a.get()
-
-                    if is_scalar_b:
-                        ary_b = make_random_array(queue, dtype_b, 1).get()[0]
-                        host_ary_b = ary_b
-                    else:
-                        ary_b = make_random_array(queue, dtype_b, size)
-                        host_ary_b = ary_b.get()
-
-                    print(op, dtype_a, dtype_b, is_scalar_a, is_scalar_b)
-                    dev_result = op(ary_a, ary_b).get()
-                    host_result = op(host_ary_a, host_ary_b)
-
-                    if host_result.dtype != dev_result.dtype:
-                        # This appears to be a numpy bug, where we get
-                        # served a Python complex that is really a
-                        # smaller numpy complex.
-
-                        print("HOST_DTYPE: %s DEV_DTYPE: %s" % (
-                                host_result.dtype, dev_result.dtype))
-
-                        dev_result = dev_result.astype(host_result.dtype)
-
-                    err = la.norm(host_result-dev_result)/la.norm(host_result)
-                    print(err)
-                    correct = err < 1e-4
-                    if not correct:
-                        print(host_result)
-                        print(dev_result)
-                        print(host_result - dev_result)
-
-                    assert correct
-
-
-def test_pow_neg1_vs_inv(ctx_factory):
-    ctx = ctx_factory()
-    queue = cl.CommandQueue(ctx)
+@first_arg_dependent_memoize
+def get_mix_complex_operands(queue, dtype):
+    """Return a random device array of *dtype*, its host copy and a random
+    scalar of *dtype*, shared by all cases of :func:`test_mix_complex`.
+    """
+    ary = make_random_array(queue, dtype, 10)
+    return ary, ary.get(), make_random_array(queue, dtype, 1).get()[0]
+
+
+MIX_COMPLEX_DTYPES = [
+        (np.float32, np.complex64),
+        #(np.int32, np.complex64),
+        (np.float32, np.float64),
+        (np.float32, np.complex128),
+        (np.float64, np.complex64),
+        (np.float64, np.complex128),
+        ]
+
+
+@pytest.mark.parametrize("is_scalar_a, is_scalar_b", [
+    (False, False),
+    (False, True),
+    (True, False),
+    ])
+@pytest.mark.parametrize("dtype_a, dtype_b",
+        MIX_COMPLEX_DTYPES
+        + [(dtype_b, dtype_a) for dtype_a, dtype_b in MIX_COMPLEX_DTYPES])
+@pytest.mark.parametrize("op", [add, sub, mul, truediv, pow])
+def test_mix_complex(queue, op, dtype_a, dtype_b, is_scalar_a, is_scalar_b):
+    device = queue.device
+    if (not has_double_support(device)
+            and set([dtype_a, dtype_b]) & set([np.float64, np.complex128])):
+        pytest.skip("double precision not supported on %s" % device)
+
+    ary_a, host_ary_a, scalar_a = get_mix_complex_operands(queue, dtype_a)
+    if is_scalar_a:
+        ary_a = host_ary_a = scalar_a
+
+    ary_b, host_ary_b, scalar_b = get_mix_complex_operands(queue, dtype_b)
+    if is_scalar_b:
+        ary_b = host_ary_b = scalar_b
+
+    dev_result = op(ary_a, ary_b).get()
+    host_result = op(host_ary_a, host_ary_b)
+
+    if host_result.dtype != dev_result.dtype:
+        # This appears to be a numpy bug, where we get
+        # served a Python complex that is really a
+        # smaller numpy complex.
+
+        dev_result = dev_result.astype(host_result.dtype)
+
+    err = la.norm(host_result-dev_result)/la.norm(host_result)
+    correct = err < 1e-4
+    if not correct:
+        print(op, dtype_a, dtype_b, is_scalar_a, is_scalar_b, err)
+        print(host_result)
+        print(dev_result)
+        print(host_result - dev_result)
+
+    assert correct
+
+
+def test_pow_neg1_vs_inv(queue):
+    ctx = queue.context
 
     device = ctx.devices[0]
     if not has_double_support(device):
@@ -176,10 +202,7 @@ def test_pow_neg1_vs_inv(ctx_factory):
     assert la.norm(res2-ref, np.inf) / la.norm(ref) < 1e-13
 
 
-def test_vector_fill(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
+def test_vector_fill(queue):
     a_gpu = cl_array.Array(queue, 100, dtype=cl_array.vec.float4)
     a_gpu.fill(cl_array.vec.make_float4(0.0, 0.0, 1.0, 0.0))
     a = a_gpu.get()
@@ -188,10 +211,7 @@ def test_vector_fill(ctx_factory):
     a_gpu = cl_array.zeros(queue, 100, dtype=cl_array.vec.float4)
 
 
-def test_absrealimag(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
+def test_absrealimag(queue):
     def real(x):
         return x.real
 
@@ -204,7 +224,6 @@ def test_absrealimag(ctx_factory):
     n = 111
     for func in [abs, real, imag, conj]:
         for dtype in [np.int32, np.float32, np.complex64]:
-            print(func, dtype)
             a = -make_random_array(queue, dtype, n)
 
             host_res = func(a.get())
@@ -212,6 +231,7 @@ def test_absrealimag(ctx_factory):
 
             correct = np.allclose(dev_res, host_res)
             if not correct:
+                print(func, dtype)
                 print(dev_res)
                 print(host_res)
                 print(dev_res-host_res)
@@ -222,10 +242,7 @@ def test_absrealimag(ctx_factory):
 
 # {{{ operators
 
-def test_rmul_yields_right_type(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
+def test_rmul_yields_right_type(queue):
     a = np.array([1, 2, 3, 4, 5]).astype(np.float32)
     a_gpu = cl_array.to_device(queue, a)
 
@@ -236,37 +253,27 @@ def test_rmul_yields_right_type(ctx_factory):
     assert isinstance(two_a, cl_array.Array)
 
 
-def test_pow_array(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
+def test_pow_array(queue):
     a = np.array([1, 2, 3, 4, 5]).astype(np.float32)
     a_gpu = cl_array.to_device(queue, a)
 
     result = pow(a_gpu, a_gpu).get()
-    assert (np.abs(a ** a - result) < 1e-3).all()
+    assert np.allclose(a ** a, result, rtol=0, atol=1e-3)
 
     result = (a_gpu ** a_gpu).get()
-    assert (np.abs(pow(a, a) - result) < 1e-3).all()
+    assert np.allclose(pow(a, a), result, rtol=0, atol=1e-3)
 
 
-def test_pow_number(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-    a_gpu = cl_array.to_device(queue, a)
+def test_pow_number(a10_gpu):
+    a, a_gpu = a10_gpu
 
     result = pow(a_gpu, 2).get()
-    assert (np.abs(a ** 2 - result) < 1e-3).all()
+    assert np.allclose(a ** 2, result, rtol=0, atol=1e-3)
 
 
-def test_multiply(ctx_factory):
+def test_multiply(queue):
     """Test the muliplication of an array with a scalar. """
 
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
     for sz in [10, 50000]:
         for dtype, scalars in [
                 (np.float32, [2]),
@@ -277,133 +284,61 @@ def test_multiply(ctx_factory):
                 a = a_gpu.get()
                 a_mult = (scalar * a_gpu).get()
 
-                assert (a * scalar == a_mult).all()
-
-
-def test_multiply_array(ctx_factory):
-    """Test the multiplication of two arrays."""
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-
-    a_gpu = cl_array.to_device(queue, a)
-    b_gpu = cl_array.to_device(queue, a)
-
-    a_squared = (b_gpu * a_gpu).get()
-
-    assert (a * a == a_squared).all()
-
-
-def test_addition_array(ctx_factory):
-    """Test the addition of two arrays."""
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-    a_gpu = cl_array.to_device(queue, a)
-    a_added = (a_gpu + a_gpu).get()
-
-    assert (a + a == a_added).all()
-
-
-def test_addition_scalar(ctx_factory):
-    """Test the addition of an array and a scalar."""
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-    a_gpu = cl_array.to_device(queue, a)
-    a_added = (7 + a_gpu).get()
-
-    assert (7 + a == a_added).all()
-
-
-def test_substract_array(ctx_factory):
-    """Test the substraction of two arrays."""
-    #test data
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-    b = np.array([10, 20, 30, 40, 50,
-                  60, 70, 80, 90, 100]).astype(np.float32)
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a_gpu = cl_array.to_device(queue, a)
-    b_gpu = cl_array.to_device(queue, b)
-
-    result = (a_gpu - b_gpu).get()
-    assert (a - b == result).all()
-
-    result = (b_gpu - a_gpu).get()
-    assert (b - a == result).all()
-
-
-def test_substract_scalar(ctx_factory):
-    """Test the substraction of an array and a scalar."""
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    #test data
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-
-    #convert a to a gpu object
-    a_gpu = cl_array.to_device(queue, a)
-
-    result = (a_gpu - 7).get()
-    assert (a - 7 == result).all()
-
-    result = (7 - a_gpu).get()
-    assert (7 - a == result).all()
-
-
-def test_divide_scalar(ctx_factory):
-    """Test the division of an array and a scalar."""
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-    a_gpu = cl_array.to_device(queue, a)
-
-    result = (a_gpu / 2).get()
-    assert (a / 2 == result).all()
-
-    result = (2 / a_gpu).get()
-    assert (np.abs(2 / a - result) < 1e-5).all()
-
-
-def test_divide_array(ctx_factory):
-    """Test the division of an array and a scalar. """
-
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    #test data
-    a = np.array([10, 20, 30, 40, 50, 60, 70, 80, 90, 100]).astype(np.float32)
-    b = np.array([10, 10, 10, 10, 10, 10, 10, 10, 10, 10]).astype(np.float32)
-
-    a_gpu = cl_array.to_device(queue, a)
-    b_gpu = cl_array.to_device(queue, b)
+                assert np.array_equal(a * scalar, a_mult)
+
+
+@pytest.mark.parametrize("op, scalar, rev_atol", [
+    (add, 7, 0),
+    (sub, 7, 0),
+    # 2 / a is inexact, but a / 2 is not
+    (truediv, 2, 1e-5),
+    ])
+def test_scalar_op(a10_gpu, op, scalar, rev_atol):
+    """Test arithmetic between an array and a scalar, in both orders.
+    *rev_atol* is the tolerance for the scalar-first order; the array-first
+    results have to match exactly.
+    """
+
+    a, a_gpu = a10_gpu
+
+    result = op(a_gpu, scalar).get()
+    assert np.array_equal(op(a, scalar), result)
+
+    result = op(scalar, a_gpu).get()
+    assert np.allclose(op(scalar, a), result, rtol=0, atol=rev_atol)
+
+
+@pytest.mark.parametrize("op, b, atol", [
+    (mul, None, 0),
+    (add, None, 0),
+    (sub, np.arange(10, 101, 10).astype(np.float32), 0),
+    (truediv, 10*np.ones(10, dtype=np.float32), 1e-3),
+    ])
+def test_array_op(queue, a10_gpu, op, b, atol):
+    """Test arithmetic between two arrays, in both orders. If *b* is *None*,
+    the second operand is a copy of the first.
+    """
+
+    a, a_gpu = a10_gpu
+    if b is None:
+        b = a
+        b_gpu = a_gpu.copy()
+    else:
+        b_gpu = cl_array.to_device(queue, b)
 
-    a_divide = (a_gpu / b_gpu).get()
-    assert (np.abs(a / b - a_divide) < 1e-3).all()
+    result = op(a_gpu, b_gpu).get()
+    assert np.allclose(op(a, b), result, rtol=0, atol=atol)
 
-    a_divide = (b_gpu / a_gpu).get()
-    assert (np.abs(b / a - a_divide) < 1e-3).all()
+    result = op(b_gpu, a_gpu).get()
+    assert np.allclose(op(b, a), result, rtol=0, atol=atol)
 
 # }}}
 
 
 # {{{ RNG
 
-def test_random(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
+def test_random(queue):
+    context = queue.context
 
     from pyopencl.clrandom import RanluxGenerator
 
@@ -418,23 +353,23 @@ def test_random(ctx_factory):
         for dtype in dtypes:
             ran = cl_array.zeros(queue, ary_size, dtype)
             gen.fill_uniform(ran)
-            assert (0 < ran.get()).all()
-            assert (ran.get() < 1).all()
+            ran_host = ran.get()
+            assert 0 < ran_host.min() and ran_host.max() < 1
 
             gen.synchronize(queue)
 
             ran = cl_array.zeros(queue, ary_size, dtype)
             gen.fill_uniform(ran, a=4, b=7)
-            assert (4 < ran.get()).all()
-            assert (ran.get() < 7).all()
+            ran_host = ran.get()
+            assert 4 < ran_host.min() and ran_host.max() < 7
 
             ran = gen.normal(queue, (10007,), dtype, mu=4, sigma=3)
 
     dtypes = [np.int32]
     for dtype in dtypes:
         ran = gen.uniform(queue, (10000007,), dtype, a=200, b=300)
-        assert (200 <= ran.get()).all()
-        assert (ran.get() < 300).all()
+        ran_host = ran.get()
+        assert 200 <= ran_host.min() and ran_host.max() < 300
         #from matplotlib import pyplot as pt
         #pt.hist(ran.get())
         #pt.show()
@@ -444,7 +379,7 @@ def test_random(ctx_factory):
 
 # {{{ misc
 
-def test_numpy_integer_shape(ctx_factory):
+def test_numpy_integer_shape(queue):
     try:
         list(np.int32(17))
     except:
@@ -452,48 +387,31 @@ def test_numpy_integer_shape(ctx_factory):
     else:
         from pytest import skip
         skip("numpy implementation does not handle scalar correctly.")
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
 
     cl_array.empty(queue, np.int32(17), np.float32)
     cl_array.empty(queue, (np.int32(17), np.int32(17)), np.float32)
 
 
-def test_len(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
+def test_len(a10_gpu):
+    a, a_gpu = a10_gpu
+    assert len(a_gpu) == 10
 
-    a = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]).astype(np.float32)
-    a_cpu = cl_array.to_device(queue, a)
-    assert len(a_cpu) == 10
-
-
-def test_stride_preservation(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
 
+def test_stride_preservation(queue):
     A = np.random.rand(3, 3)
     AT = A.T
-    print(AT.flags.f_contiguous, AT.flags.c_contiguous)
     AT_GPU = cl_array.to_device(queue, AT)
-    print(AT_GPU.flags.f_contiguous, AT_GPU.flags.c_contiguous)
     assert np.allclose(AT_GPU.get(), AT)
 
 
-def test_nan_arithmetic(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
+@pytest.mark.parametrize("size", [1 << 14, 1 << 20])
+def test_nan_arithmetic(queue, size):
     def make_nan_contaminated_vector(size):
         shape = (size,)
         a = np.random.randn(*shape).astype(np.float32)
-        from random import randrange
-        for i in range(size // 10):
-            a[randrange(0, size)] = float('nan')
+        a[np.random.randint(0, size, size // 10)] = float('nan')
         return a
 
-    size = 1 << 20
-
     a = make_nan_contaminated_vector(size)
     a_gpu = cl_array.to_device(queue, a)
     b = make_nan_contaminated_vector(size)
@@ -502,12 +420,10 @@ def test_nan_arithmetic(ctx_factory):
     ab = a * b
     ab_gpu = (a_gpu * b_gpu).get()
 
-    assert (np.isnan(ab) == np.isnan(ab_gpu)).all()
+    assert np.array_equal(np.isnan(ab), np.isnan(ab_gpu))
 
 
-def test_mem_pool_with_arrays(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
+def test_mem_pool_with_arrays(queue):
     mem_pool = cl_tools.MemoryPool(cl_tools.ImmediateAllocator(queue))
 
     a_dev = cl_array.arange(queue, 2000, dtype=np.float32, allocator=mem_pool)
@@ -517,12 +433,8 @@ def test_mem_pool_with_arrays(ctx_factory):
     assert b_dev.allocator is mem_pool
 
 
-def test_view(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a = np.arange(128).reshape(8, 16).astype(np.float32)
-    a_dev = cl_array.to_device(queue, a)
+def test_view(a128_gpu):
+    a, a_dev = a128_gpu
 
     # same dtype
     view = a_dev.view()
@@ -537,18 +449,13 @@ def test_view(ctx_factory):
     assert view.shape == (8, 32) and view.dtype == np.int16
 
 
-def test_diff(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    from pyopencl.clrandom import rand as clrand
-
+def test_diff(queue):
     l = 20000
-    a_dev = clrand(queue, (l,), dtype=np.float32)
+    a_dev = host_clrand(queue, (l,), dtype=np.float32)
     a = a_dev.get()
 
-    err = la.norm(
-            (cl.array.diff(a_dev).get() - np.diff(a)))
+    with host_view(cl.array.diff(a_dev)) as diff:
+        err = la.norm(diff - np.diff(a))
     assert err < 1e-4
 
 # }}}
@@ -556,10 +463,7 @@ def test_diff(ctx_factory):
 
 # {{{ slices, concatenation
 
-def test_slice(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
+def test_slice(queue):
     from pyopencl.clrandom import rand as clrand
 
     l = 20000
@@ -578,6 +482,9 @@ def test_slice(ctx_factory):
 
         assert la.norm(a_gpu_slice.get() - a_slice) == 0
 
+    # Only the assigned range is read back after each assignment; stray
+    # writes outside of it are caught by the full comparison after each loop.
+
     for i in range(20):
         start = randrange(l)
         end = randrange(start, l)
@@ -585,7 +492,9 @@ def test_slice(ctx_factory):
         a_gpu[start:end] = 2*b[start:end]
         a[start:end] = 2*b[start:end]
 
-        assert la.norm(a_gpu.get() - a) == 0
+        assert np.array_equal(a_gpu[start:end].get(), a[start:end])
+
+    assert np.array_equal(a_gpu.get(), a)
 
     for i in range(20):
         start = randrange(l)
@@ -594,18 +503,15 @@ def test_slice(ctx_factory):
         a_gpu[start:end] = 2*b_gpu[start:end]
         a[start:end] = 2*b[start:end]
 
-        assert la.norm(a_gpu.get() - a) == 0
-
+        assert np.array_equal(a_gpu[start:end].get(), a[start:end])
 
-def test_concatenate(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
+    assert np.array_equal(a_gpu.get(), a)
 
-    from pyopencl.clrandom import rand as clrand
 
-    a_dev = clrand(queue, (5, 15, 20), dtype=np.float32)
-    b_dev = clrand(queue, (4, 15, 20), dtype=np.float32)
-    c_dev = clrand(queue, (3, 15, 20), dtype=np.float32)
+def test_concatenate(queue):
+    a_dev = host_clrand(queue, (5, 15, 20), dtype=np.float32)
+    b_dev = host_clrand(queue, (4, 15, 20), dtype=np.float32)
+    c_dev = host_clrand(queue, (3, 15, 20), dtype=np.float32)
     a = a_dev.get()
     b = b_dev.get()
     c = c_dev.get()
@@ -613,22 +519,18 @@ def test_concatenate(ctx_factory):
     cat_dev = cl.array.concatenate((a_dev, b_dev, c_dev))
     cat = np.concatenate((a, b, c))
 
-    assert la.norm(cat - cat_dev.get()) == 0
+    with host_view(cat_dev) as cat_from_dev:
+        assert la.norm(cat - cat_from_dev) == 0
 
 # }}}
 
 
 # {{{ conditionals, any, all
 
-def test_comparisons(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    from pyopencl.clrandom import rand as clrand
-
+def test_comparisons(queue):
     l = 20000
-    a_dev = clrand(queue, (l,), dtype=np.float32)
-    b_dev = clrand(queue, (l,), dtype=np.float32)
+    a_dev = host_clrand(queue, (l,), dtype=np.float32)
+    b_dev = host_clrand(queue, (l,), dtype=np.float32)
 
     a = a_dev.get()
     b = b_dev.get()
@@ -638,23 +540,23 @@ def test_comparisons(ctx_factory):
         res_dev = op(a_dev, b_dev)
         res = op(a, b)
 
-        assert (res_dev.get() == res).all()
+        with host_view(res_dev) as res_from_dev:
+            assert np.array_equal(res_from_dev, res)
 
         res_dev = op(a_dev, 0)
         res = op(a, 0)
 
-        assert (res_dev.get() == res).all()
+        with host_view(res_dev) as res_from_dev:
+            assert np.array_equal(res_from_dev, res)
 
         res_dev = op(0, b_dev)
         res = op(0, b)
 
-        assert (res_dev.get() == res).all()
-
+        with host_view(res_dev) as res_from_dev:
+            assert np.array_equal(res_from_dev, res)
 
-def test_any_all(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
 
+def test_any_all(queue):
     l = 20000
     a_dev = cl_array.zeros(queue, (l,), dtype=np.int8)
 
@@ -674,16 +576,8 @@ def test_any_all(ctx_factory):
 # }}}
 
 
-def test_map_to_host(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    if context.devices[0].type & cl.device_type.GPU:
-        mf = cl.mem_flags
-        allocator = cl_tools.DeferredAllocator(
-                context, mf.READ_WRITE | mf.ALLOC_HOST_PTR)
-    else:
-        allocator = None
+def test_map_to_host(queue):
+    allocator = get_host_allocator(queue.context)
 
     a_dev = cl_array.zeros(queue, (5, 6, 7,), dtype=np.float32, allocator=allocator)
     a_dev[3, 2, 1] = 10
@@ -698,13 +592,10 @@ def test_map_to_host(ctx_factory):
     print("DEV[HOST_WRITE]", a_dev.get()[1, 2, 3])
     print("HOST[DEV_WRITE]", a_host_saved[3, 2, 1])
 
-    assert (a_host_saved == a_dev.get()).all()
-
+    assert np.array_equal(a_host_saved, a_dev.get())
 
-def test_view_and_strides(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
 
+def test_view_and_strides(queue):
     from pyopencl.clrandom import rand as clrand
 
     X = clrand(queue, (5, 10), dtype=np.float32)
@@ -719,10 +610,7 @@ def test_view_and_strides(ctx_factory):
         assert (y.get() == X.get()[:3, :5]).all()
 
 
-def test_meshmode_view(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
+def test_meshmode_view(queue):
     n = 2
     result = cl.array.empty(queue, (2, n*6), np.float32)
 
@@ -737,10 +625,14 @@ def test_meshmode_view(ctx_factory):
     assert (view(x) == 1).all()
 
 
-def test_event_management(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
+def _cheap_fill(ary):
+    # Only exercises the event pruning in Array.add_event: a marker is much
+    # cheaper to enqueue than the fill kernel and produces an event all the
+    # same. Not a replacement for Array.fill.
+    ary.add_event(cl.enqueue_marker(ary.queue))
+
 
+def test_event_management(queue):
     from pyopencl.clrandom import rand as clrand
 
     x = clrand(queue, (5, 10), dtype=np.float32)
@@ -750,6 +642,15 @@ def test_event_management(ctx_factory):
 
     assert len(x.events) == 0
 
+    # The expressions below are independent of each other, so let the device
+    # overlap them if it can. (Generate *x* in order, though: the RNG does
+    # not wait for its own state initialization.)
+    cqp = cl.command_queue_properties
+    if queue.device.queue_properties & cqp.OUT_OF_ORDER_EXEC_MODE_ENABLE:
+        queue = cl.CommandQueue(queue.context,
+                properties=cqp.OUT_OF_ORDER_EXEC_MODE_ENABLE)
+        x = x.with_queue(queue)
+
     y = x+x
     assert len(y.events) == 1
     y = x*x
@@ -765,23 +666,22 @@ def test_event_management(ctx_factory):
     y = 2**x
     assert len(y.events) == 1
 
+    # fill() does not wait for the readers of *x* above
+    queue.finish()
+
     for i in range(10):
         x.fill(0)
 
     assert len(x.events) == 10
 
     for i in range(1000):
-        x.fill(0)
+        _cheap_fill(x)
 
     assert len(x.events) < 100
 
 
-def test_reshape(ctx_factory):
-    context = ctx_factory()
-    queue = cl.CommandQueue(context)
-
-    a = np.arange(128).reshape(8, 16).astype(np.float32)
-    a_dev = cl_array.to_device(queue, a)
+def test_reshape(a128_gpu):
+    a, a_dev = a128_gpu
 
     # different ways to specify the shape
     a_dev.reshape(4, 32)
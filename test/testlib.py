@@ -0,0 +1,57 @@
+"""Helpers shared by the test modules."""
+
+from __future__ import division
+
+import numpy as np
+from contextlib import contextmanager
+
+import pyopencl as cl
+import pyopencl.tools as cl_tools
+from pyopencl.tools import context_dependent_memoize
+
+
+# fixed seed so that failures are reproducible
+try:
+    host_rng = np.random.default_rng(0xC0FFEE)
+except AttributeError:
+    # numpy < 1.17
+    host_rng = np.random.RandomState(0xC0FFEE)
+
+
+def host_randint(low, high, size, dtype):
+    if isinstance(host_rng, np.random.RandomState):
+        return host_rng.randint(low, high, size).astype(dtype)
+    else:
+        return host_rng.integers(low, high, size, dtype=dtype)
+
+
+@context_dependent_memoize
+def get_host_allocator(context):
+    """Return an allocator for buffers in host-accessible (``ALLOC_HOST_PTR``)
+    memory on GPUs, or *None* on other devices, where device memory already
+    is host memory.
+    """
+    if context.devices[0].type & cl.device_type.GPU:
+        mf = cl.mem_flags
+        return cl_tools.DeferredAllocator(
+                context, mf.READ_WRITE | mf.ALLOC_HOST_PTR)
+    else:
+        return None
+
+
+@contextmanager
+def host_view(ary):
+    """Yield the contents of *ary* as a :class:`numpy.ndarray`. Arrays
+    allocated through :func:`get_host_allocator` are mapped rather than
+    copied.
+    """
+    allocator = get_host_allocator(ary.context)
+    if allocator is not None and ary.allocator is allocator:
+        host_ary = ary.map_to_host(flags=cl.map_flags.READ,
+                wait_for=ary.events)
+        try:
+            yield host_ary
+        finally:
+            host_ary.base.release(ary.queue)
+    else:
+        yield ary.get()